@@ -1,6 +1,10 @@
+import io
 import streamlit as st
 import pandas as pd
-import plotly.express as px
+import plotly.graph_objects as go
+
+# Factor tables and the calculation live in a module so they are built once per process, not on every rerun
+from cbam_core import cn_codes, result_columns, calculate
 
 # ---------------------- Page Setup ----------------------
 st.set_page_config(page_title="EinTrust CBAM Assistant", layout="wide")
@@ -10,35 +14,19 @@ This tool helps manufacturers calculate potential CBAM fees for exporting to the
 Just enter basic production data — no technical knowledge required.  
 """)
 
-# ---------------------- Emission Factors ----------------------
-emission_factors = {
-    "products": {"Steel":1.8, "Cement":0.9, "Aluminium":12.0, "Fertilizer":3.0},
-    "fuels": {"Coal":2.5, "Diesel":2.7, "Natural Gas":2.0},
-    "electricity":0.7,
-    "transport":{"Truck":0.2, "Rail":0.05, "Ship":0.01, "Air":0.6}
-}
-
-# ---------------------- CN Codes ----------------------
-cn_codes = {
-    "Steel": ["7208 10 00","7208 25 00","7208 26 00"],
-    "Cement": ["2523 10 00","2523 29 00"],
-    "Aluminium": ["7601 10 00","7601 20 00"],
-    "Fertilizer": ["3102 10 00","3102 21 00"]
-}
-
-cn_emission_factors = {
-    "7208 10 00":1.85, "7208 25 00":1.80, "7208 26 00":1.82,
-    "2523 10 00":0.92, "2523 29 00":0.88,
-    "7601 10 00":12.5, "7601 20 00":11.8,
-    "3102 10 00":3.2, "3102 21 00":2.9
-}
-
 # ---------------------- Session State ----------------------
-if "df_products" not in st.session_state:
-    st.session_state.df_products = pd.DataFrame(columns=[
-        "Product","CN Code","Quantity","Electricity","Fuel Type","Fuel Quantity",
-        "Purchased Materials","Transport Distance","Transport Mode"
-    ])
+product_columns = [
+    "Product","CN Code","Quantity","Electricity","Fuel Type","Fuel Quantity",
+    "Purchased Materials","Transport Distance","Transport Mode"
+]
+numeric_columns = ["Quantity","Electricity","Fuel Quantity","Purchased Materials","Transport Distance"]
+category_columns = ["Product","CN Code","Fuel Type","Transport Mode"]
+# Results keep full precision; tables show two decimals
+two_decimals = {c: st.column_config.NumberColumn(format="%.2f") for c in result_columns + ["Investment (€)","Net Savings (€)"]}
+
+# Rows are kept as plain dicts; the DataFrame is built once per rerun below
+if "products" not in st.session_state:
+    st.session_state.products = []
 
 # ---------------------- Step 1: Add Product Data ----------------------
 st.header("Step 1: Enter Product Data")
@@ -60,98 +48,97 @@ with st.form("product_form", clear_on_submit=True):
     
     submitted = st.form_submit_button("Add Product")
     if submitted:
-        st.session_state.df_products = pd.concat([st.session_state.df_products,
-            pd.DataFrame([{
-                "Product": product,
-                "CN Code": cn_code,
-                "Quantity": qty,
-                "Electricity": elec,
-                "Fuel Type": fuel_type if fuel_type != "None" else "",
-                "Fuel Quantity": fuel_qty,
-                "Purchased Materials": purchased_materials,
-                "Transport Distance": transport_distance,
-                "Transport Mode": transport_mode
-            }])
-        ], ignore_index=True)
+        st.session_state.products.append({
+            "Product": product,
+            "CN Code": cn_code,
+            "Quantity": qty,
+            "Electricity": elec,
+            "Fuel Type": fuel_type if fuel_type != "None" else "",
+            "Fuel Quantity": fuel_qty,
+            "Purchased Materials": purchased_materials,
+            "Transport Distance": transport_distance,
+            "Transport Mode": transport_mode
+        })
         st.success(f"{product} with CN code {cn_code} added!")
 
+df_raw = pd.DataFrame(st.session_state.products, columns=product_columns)
+df_raw[numeric_columns] = df_raw[numeric_columns].apply(pd.to_numeric, errors="coerce").astype("float64")
+# Repeated text columns are dictionary-encoded; lookup_factors recodes them against each factor table's own category order
+df_raw[category_columns] = df_raw[category_columns].astype("category")
+
 st.subheader("Current Product List")
-st.dataframe(st.session_state.df_products)
+st.dataframe(df_raw)
 
 # ---------------------- Step 2: Carbon Prices ----------------------
 st.header("Step 2: Enter Carbon Prices")
 eu_ets_price = st.number_input("EU ETS Price (€ per tCO₂)", min_value=0.0, value=100.0, format="%.2f")
 local_price = st.number_input("Local Carbon Price (€ per tCO₂, optional)", min_value=0.0, value=0.0, format="%.2f")
 
-# ---------------------- Step 3: Reduction Strategies ----------------------
-st.header("Step 3: Explore Reduction Strategies")
-st.subheader("Adjust sliders to see how renewable energy or efficiency improvements reduce CBAM fees.")
-solar_pct = st.slider("% Electricity from Renewable (Solar/Wind)", min_value=0, max_value=100, value=20)
-efficiency_pct = st.slider("% Process Efficiency Improvement", min_value=0, max_value=50, value=10)
-investment = st.number_input("Investment Required (€)", min_value=0.0, value=5000.0, format="%.2f")
-
-# ---------------------- Step 4: Calculate Emissions & CBAM Fees ----------------------
-st.header("Step 4: Results")
-
-df_raw = st.session_state.df_products
-if df_raw.empty:
-    st.warning("Add at least one product to calculate.")
-else:
-    results = []
-    for idx, row in df_raw.iterrows():
-        try:
-            factor = cn_emission_factors.get(row["CN Code"], emission_factors["products"].get(row["Product"],1.0))
-            
-            # Scope 1
-            scope1 = row["Quantity"] * factor
-            if row["Fuel Type"] in emission_factors["fuels"]:
-                scope1 += row["Fuel Quantity"] * emission_factors["fuels"][row["Fuel Type"]]
-            scope1 *= (1 - efficiency_pct/100)
-
-            # Scope 2
-            scope2 = row["Electricity"] * emission_factors["electricity"] * (1 - solar_pct/100)
-
-            # Scope 3
-            scope3 = row["Purchased Materials"] * factor
-            if row["Transport Mode"] in emission_factors["transport"]:
-                scope3 += row["Quantity"] * row["Transport Distance"] * emission_factors["transport"][row["Transport Mode"]]
-            scope3 *= (1 - efficiency_pct/100)
-
-            total_emissions = scope1 + scope2 + scope3
-            cbam_fee = total_emissions * max(eu_ets_price - local_price,0)
-
-            results.append({
-                "Product": row["Product"],
-                "CN Code": row["CN Code"],
-                "Scope 1 (Direct)": round(scope1,2),
-                "Scope 2 (Electricity)": round(scope2,2),
-                "Scope 3 (Other)": round(scope3,2),
-                "Total Emissions (tCO₂)": round(total_emissions,2),
-                "CBAM Fee (€)": round(cbam_fee,2)
-            })
-        except Exception as e:
-            st.warning(f"Error processing row {idx}: {e}")
-
-    df_results = pd.DataFrame(results)
+# ---------------------- Cached Builders ----------------------
+@st.cache_data(show_spinner=False)
+def build_stack_fig(df_stack):
+    # One go.Bar per scope straight from the column arrays; no wide-to-long melt as in px.bar
+    products = df_stack.index.to_numpy()
+    fig = go.Figure([go.Bar(name=col, x=products, y=df_stack[col].to_numpy()) for col in df_stack.columns])
+    fig.update_layout(barmode="stack", title="Scope Emissions per Product", xaxis_title="Product", yaxis_title="tCO₂")
+    return fig
+
+@st.cache_data(show_spinner=False)
+def to_csv_bytes(df):
+    # Written straight into a byte buffer, without an intermediate str of the whole file
+    buf = io.BytesIO()
+    df.to_csv(buf, index=False, float_format="%.2f", encoding="utf-8")
+    return buf.getvalue()
+
+# ---------------------- Steps 3 & 4: Strategy and Results ----------------------
+# Runs as a fragment: moving a slider reruns only this block, not the product form and table above
+@st.fragment
+def strategy_and_results(df_raw, eu_ets_price, local_price):
+    # ---------------------- Step 3: Reduction Strategies ----------------------
+    st.header("Step 3: Explore Reduction Strategies")
+    st.subheader("Adjust sliders to see how renewable energy or efficiency improvements reduce CBAM fees.")
+    solar_pct = st.slider("% Electricity from Renewable (Solar/Wind)", min_value=0, max_value=100, value=20)
+    efficiency_pct = st.slider("% Process Efficiency Improvement", min_value=0, max_value=50, value=10)
+    investment = st.number_input("Investment Required (€)", min_value=0.0, value=5000.0, format="%.2f")
+
+    # ---------------------- Step 4: Calculate Emissions & CBAM Fees ----------------------
+    st.header("Step 4: Results")
+
+    if df_raw.empty:
+        st.warning("Add at least one product to calculate.")
+        return
+
+    # Rows with missing or non-numeric inputs are reported once and left out of the calculation
+    invalid = df_raw[numeric_columns].isna().any(axis=1)
+    if invalid.any():
+        st.warning(f"Skipping {invalid.sum()} row(s) with invalid numbers: {df_raw.index[invalid].tolist()}")
+    df_results = calculate(df_raw[~invalid], solar_pct, efficiency_pct, eu_ets_price, local_price)
     st.subheader("Emissions & CBAM Fee per Product")
-    st.dataframe(df_results)
+    st.dataframe(df_results, column_config=two_decimals)
 
     # Summary
-    summary = df_results[["Total Emissions (tCO₂)","CBAM Fee (€)"]].sum().to_frame().T
-    summary["Investment (€)"] = investment
-    summary["Net Savings (€)"] = summary["CBAM Fee (€)"] - investment
+    total_emissions = df_results["Total Emissions (tCO₂)"].to_numpy().sum()
+    total_fee = df_results["CBAM Fee (€)"].to_numpy().sum()
+    net_savings = total_fee - investment
+    summary = pd.DataFrame({
+        "Total Emissions (tCO₂)": [total_emissions],
+        "CBAM Fee (€)": [total_fee],
+        "Investment (€)": [investment],
+        "Net Savings (€)": [net_savings]
+    })
     st.subheader("Strategy Summary")
-    st.dataframe(summary)
+    st.dataframe(summary, column_config=two_decimals)
 
-    st.success(f"Recommended Strategy: Implementing this strategy could save €{round(summary['Net Savings (€)'].values[0],2)}")
+    st.success(f"Recommended Strategy: Implementing this strategy could save €{round(net_savings,2)}")
 
     # Emissions Breakdown Chart
     st.subheader("Emissions Breakdown")
     df_stack = df_results[["Product","Scope 1 (Direct)","Scope 2 (Electricity)","Scope 3 (Other)"]].set_index("Product")
-    fig = px.bar(df_stack, x=df_stack.index, y=["Scope 1 (Direct)","Scope 2 (Electricity)","Scope 3 (Other)"],
-                 title="Scope Emissions per Product", labels={"value":"tCO₂","Product":"Product"})
-    st.plotly_chart(fig, use_container_width=True)
+    # One bar per product type, however many rows were entered
+    df_stack = df_stack.groupby(level=0, observed=True, sort=False).sum()
+    st.plotly_chart(build_stack_fig(df_stack), use_container_width=True)
 
     # CSV Download
-    csv = df_results.to_csv(index=False).encode('utf-8')
-    st.download_button("Download Detailed CSV", data=csv, file_name="cbam_results.csv", mime="text/csv")
+    st.download_button("Download Detailed CSV", data=to_csv_bytes(df_results), file_name="cbam_results.csv", mime="text/csv")
+
+strategy_and_results(df_raw, eu_ets_price, local_price)
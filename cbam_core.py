@@ -0,0 +1,97 @@
+import streamlit as st
+import pandas as pd
+import numpy as np
+
+# ---------------------- Emission Factors ----------------------
+emission_factors = {
+    "products": {"Steel":1.8, "Cement":0.9, "Aluminium":12.0, "Fertilizer":3.0},
+    "fuels": {"Coal":2.5, "Diesel":2.7, "Natural Gas":2.0},
+    "electricity":0.7,
+    "transport":{"Truck":0.2, "Rail":0.05, "Ship":0.01, "Air":0.6}
+}
+
+# ---------------------- CN Codes ----------------------
+cn_codes = {
+    "Steel": ["7208 10 00","7208 25 00","7208 26 00"],
+    "Cement": ["2523 10 00","2523 29 00"],
+    "Aluminium": ["7601 10 00","7601 20 00"],
+    "Fertilizer": ["3102 10 00","3102 21 00"]
+}
+
+cn_emission_factors = {
+    "7208 10 00":1.85, "7208 25 00":1.80, "7208 26 00":1.82,
+    "2523 10 00":0.92, "2523 29 00":0.88,
+    "7601 10 00":12.5, "7601 20 00":11.8,
+    "3102 10 00":3.2, "3102 21 00":2.9
+}
+
+# ---------------------- Factor Lookup ----------------------
+def build_factor_lookup(table, default):
+    # Returns (category dtype, factors); the default is the last factor, so code -1 resolves to it
+    factors = np.fromiter(table.values(), dtype=float, count=len(table))
+    return pd.CategoricalDtype(list(table)), np.append(factors, default)
+
+# Built once at import; every calculation reuses the same arrays
+product_lookup = build_factor_lookup(emission_factors["products"], 1.0)
+cn_lookup = build_factor_lookup(cn_emission_factors, np.nan)
+fuel_lookup = build_factor_lookup(emission_factors["fuels"], 0.0)
+transport_lookup = build_factor_lookup(emission_factors["transport"], 0.0)
+
+def lookup_factors(values, lookup):
+    # Recode against the table's category order; astype() is a no-op for a column with the same categories in another order
+    dtype, factors = lookup
+    return factors[pd.Categorical(values, dtype=dtype).codes]
+
+# Regression check: a categorical column holding every key in another order, plus an unknown value,
+# must gather each key's own factor and the default (code -1) for the unknown one
+for table, lookup in [(emission_factors["products"], product_lookup), (cn_emission_factors, cn_lookup),
+                      (emission_factors["fuels"], fuel_lookup), (emission_factors["transport"], transport_lookup)]:
+    keys = pd.Series(list(table)[::-1] + ["<unknown>"], dtype="category")
+    expected = list(table.values())[::-1] + [lookup[1][-1]]
+    assert np.array_equal(lookup_factors(keys, lookup), expected, equal_nan=True), "factor lookup out of order"
+
+# ---------------------- Calculation ----------------------
+result_columns = ["Scope 1 (Direct)","Scope 2 (Electricity)","Scope 3 (Other)","Total Emissions (tCO₂)","CBAM Fee (€)"]
+
+@st.cache_data(show_spinner=False)
+def base_emissions(df_raw):
+    # Slider-independent part, recomputed only when the product list changes
+    # Emission factors per row (CN code first, then product, then 1.0)
+    cn_factor = lookup_factors(df_raw["CN Code"], cn_lookup)
+    factor = np.where(np.isnan(cn_factor), lookup_factors(df_raw["Product"], product_lookup), cn_factor)
+    fuel_factor = lookup_factors(df_raw["Fuel Type"], fuel_lookup)
+    transport_factor = lookup_factors(df_raw["Transport Mode"], transport_lookup)
+
+    # Unscaled Scope 1 and Scope 3
+    scope1 = df_raw["Quantity"].to_numpy() * factor + df_raw["Fuel Quantity"].to_numpy() * fuel_factor
+    scope3 = df_raw["Purchased Materials"].to_numpy() * factor + df_raw["Quantity"].to_numpy() * df_raw["Transport Distance"].to_numpy() * transport_factor
+    return scope1, scope3
+
+def calculate_emissions(df_raw, solar_pct, efficiency_pct):
+    base_scope1, base_scope3 = base_emissions(df_raw)
+
+    # Strategy scalars are folded once so each scope takes a single multiply per row
+    process_scale = 1 - efficiency_pct/100
+    grid_factor = emission_factors["electricity"] * (1 - solar_pct/100)
+
+    # Scope 1
+    scope1 = base_scope1 * process_scale
+
+    # Scope 2
+    scope2 = df_raw["Electricity"].to_numpy() * grid_factor
+
+    # Scope 3
+    scope3 = base_scope3 * process_scale
+
+    total_emissions = scope1 + scope2 + scope3
+
+    # Numeric results are built as one float64 frame, then the text columns are joined on; rounding is left to display time
+    df_scopes = pd.DataFrame(np.column_stack([scope1, scope2, scope3, total_emissions]), columns=result_columns[:-1], index=df_raw.index)
+    return df_raw[["Product","CN Code"]].join(df_scopes)
+
+def calculate(df_raw, solar_pct, efficiency_pct, eu_ets_price, local_price):
+    # Prices only scale the fee; emissions never depend on them
+    df_results = calculate_emissions(df_raw, solar_pct, efficiency_pct)
+    net_price = max(eu_ets_price - local_price, 0.0)
+    df_results["CBAM Fee (€)"] = df_results["Total Emissions (tCO₂)"] * net_price
+    return df_results